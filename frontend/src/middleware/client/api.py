@@ -1,32 +1,25 @@
 import psutil
 import platform
+from socket import AF_INET
 
-from enum import Enum
+from enum import IntEnum
 from flask import Flask, jsonify, request
-from functools import total_ordering
 from gevent.pywsgi import WSGIServer  # For asynchronous handling
 from threading import Thread
 
 from client.errors import Errors
 from client.endpoint import Endpoint
-from client.util import get_parameters
+from client.util import get_parameters, create_listener
 from custom_logging import logger
 
 
 # region --- Utils ---
 
 
-@total_ordering
-class APIState(Enum):
-    NEW = 'NEW'
-    INIT = 'INIT'
-    LIVE = 'LIVE'
-
-    def __lt__(self, other):
-        if self.__class__ is other.__class__:
-            arr = list(self.__class__)
-            return arr.index(self) < arr.index(other)
-        return NotImplemented
+class APIState(IntEnum):  # Ordered so states compare as plain ints
+    NEW = 0
+    INIT = 1
+    LIVE = 2
 # endregion
 
 
@@ -37,9 +30,8 @@ class ClientAPI(Thread):
     # Try to get default en0 address to start client API endpoint on
     key = 'WiFi 2' if platform.system() == 'Windows' else 'en11'  # TODO: Ad-hoc support
 
-    for prop in psutil.net_if_addrs()[key]:
-        if prop.family == 2:
-            ip = prop.address
+    ip = next((prop.address for prop in psutil.net_if_addrs().get(key, ())
+               if prop.family == AF_INET), None)
 
     DEFAULT_ENDPOINT = Endpoint(ip if ip else '127.0.0.1', 4000)
 
@@ -114,7 +106,8 @@ class ClientAPI(Thread):
                 logger.info(f"Serving Client API at {cls.endpoint}.")
 
                 cls.state = APIState.LIVE
-                cls.http_server = WSGIServer(tuple(cls.endpoint), cls.app)
+                cls.http_server = WSGIServer(
+                    create_listener(tuple(cls.endpoint)), cls.app)
                 cls.http_server.serve_forever()
             except OSError as e:
                 logger.error(f"Endpoint {cls.endpoint} in use.")
@@ -131,7 +124,7 @@ class ClientAPI(Thread):
         logger.info("Killing Client API.")
         if cls.state != APIState.LIVE:
             logger.error(f"Cannot kill Client API when not {
-                             APIState.LIVE}.")
+                             APIState.LIVE.name}.")
             return
         cls.http_server.stop()
         cls.state = APIState.INIT
@@ -1,16 +1,70 @@
 import socketio
 import asyncio
+import platform
+import subprocess
 import pyaudio
 import ffmpeg
+import struct
 import cv2
+import numpy as np
 
 from flask_socketio import send
 from flask_socketio.namespace import Namespace as FlaskNamespace
+from collections import deque
+from functools import lru_cache
+from queue import Empty, SimpleQueue
 from socketio import ClientNamespace
-from threading import Thread
+from threading import Event, Thread, Timer
+from time import monotonic, sleep
 
 from client.encryption import KeyGenerators, KeyGenFactory, EncryptSchemes, EncryptFactory
 from client.util import ClientState, display_message
+from custom_logging import logger
+
+# Big-endian uint32 key index prefixed to every AV message
+_HDR = struct.Struct('>I')
+
+# Low-latency options for each H.264 encoder, in order of preference;
+# libx264 is the software fallback and always last
+H264_ENCODERS = {
+    'h264_videotoolbox': {'pix_fmt': 'yuv420p', 'realtime': 1},
+    'h264_nvenc': {'pix_fmt': 'yuv420p', 'preset': 'p1', 'tune': 'ull'},
+    'h264_qsv': {'pix_fmt': 'nv12', 'preset': 'veryfast'},
+    'libx264': {'pix_fmt': 'yuv420p', 'preset': 'ultrafast',
+                'tune': 'zerolatency'},
+}
+
+
+@lru_cache(maxsize=1)
+def pick_h264_encoder():
+    """
+    Returns the name of the first H.264 encoder in `H264_ENCODERS` that can
+    actually encode on this machine. Hardware encoders are often compiled
+    into ffmpeg without the device being present, so each candidate is
+    tried on a single test frame rather than trusted from `-encoders`.
+    """
+    candidates = list(H264_ENCODERS)
+    if platform.system() != 'Darwin':
+        candidates.remove('h264_videotoolbox')
+    for vcodec in candidates[:-1]:
+        # Probe with the exact options the stream will use, so an encoder
+        # that passes here cannot reject them at stream start
+        options = []
+        for option, value in H264_ENCODERS[vcodec].items():
+            options += ['-' + option, str(value)]
+        try:
+            probe = subprocess.run(
+                ['ffmpeg', '-hide_banner', '-loglevel', 'error',
+                 '-f', 'lavfi', '-i', 'color=size=256x256',
+                 '-frames:v', '1', '-c:v', vcodec, *options,
+                 '-f', 'null', '-'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        if probe.returncode == 0:
+            return vcodec
+    return candidates[-1]
 
 # region --- Tests ---
 
@@ -44,10 +98,7 @@ class TestClientNamespace(ClientNamespace):
 
     def on_message(self, user_id, msg):
         msg = '/test: ' + msg
-
-        async def disp():
-            display_message(user_id, msg)
-        asyncio.run(disp())
+        display_message(user_id, msg)
 
 # endregion
 
@@ -93,87 +144,72 @@ class AVClientNamespace(ClientNamespace):
 # endregion
 
 
-# region --- Key Distributions ---
-
-class KeyClientNamespace(AVClientNamespace):
-
-    def on_connect(self):
-        super().on_connect()
-        self.key_idx = 0
-
-        async def gen_keys():
-            await asyncio.sleep(2)
-            while True:
-                self.av.key_gen.generate_key(key_length=128)
-                key = self.key_idx.to_bytes(
-                    4, 'big') + self.av.key_gen.get_key().tobytes()
-                self.key_idx += 1
-
-                await self.av.key_queue[self.cls.user_id]
-                [self.namespace].put(key)
-
-                await asyncio.sleep(1)
-
-        Thread(target=asyncio.run, args=(gen_keys(),)).start()
-
-    def on_message(self, user_id, msg):
-        super().on_message(user_id, msg)
-
-# endregion
-
-
 # region --- Audio ---
 
 class AudioClientNamespace(AVClientNamespace):
 
     def on_connect(self):
         super().on_connect()
-        audio = pyaudio.PyAudio()
-        self.stream = audio.open(format=pyaudio.paInt16, channels=1,
-                                 rate=self.av.sample_rate, output=True,
-                                 frames_per_buffer=self.av.frames_per_buffer)
+        # One PortAudio instance serves both directions
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16, channels=1, rate=self.av.sample_rate,
+            output=True, frames_per_buffer=self.av.frames_per_buffer)
         self.stream.start_stream()
 
-        async def send_audio():
-            await asyncio.sleep(2)
-            audio = pyaudio.PyAudio()
-            stream = audio.open(format=pyaudio.paInt16, channels=1,
-                                rate=self.av.sample_rate, input=True,
-                                frames_per_buffer=self.av.frames_per_buffer)
-
-            while True:
-                cur_key_idx, key = self.av.key
-
-                data = stream.read(self.av.frames_per_buffer,
-                                   exception_on_overflow=False)
-
-                if self.av.encryption is not None:
-                    data = self.av.encryption.encrypt(data, key)
-                self.send(cur_key_idx.to_bytes(4, 'big') + data)
-                await asyncio.sleep(self.av.audio_wait)
-
-        Thread(target=asyncio.run, args=(send_audio(),)).start()
+        self.input_stream = None
+        self.capture_timer = Timer(2, self.start_capture)
+        self.capture_timer.start()
+
+    def start_capture(self):
+        # In callback mode PortAudio calls capture_audio as each buffer
+        # fills, so sends are paced by the capture device rather than a
+        # sleep loop. The callback runs on PortAudio's real-time thread, so
+        # it only queues the buffer; send_audio encrypts and sends it
+        self.captured = SimpleQueue()
+        Thread(target=self.send_audio, args=(self.captured,),
+               daemon=True).start()
+        self.input_stream = self.audio.open(
+            format=pyaudio.paInt16, channels=1, rate=self.av.sample_rate,
+            input=True, frames_per_buffer=self.av.frames_per_buffer,
+            stream_callback=self.capture_audio)
+
+    def capture_audio(self, data, frame_count, time_info, status):
+        self.captured.put(data)
+        return None, pyaudio.paContinue
+
+    def send_audio(self, captured):
+        """Encrypts and sends captured buffers until it is handed None."""
+        while (data := captured.get()) is not None:
+            header, key = self.av.key
+            if self.av.encryption is not None:
+                data = self.av.encryption.encrypt(data, key)
+            self.send(header + data)
 
     def on_message(self, user_id, msg):
         super().on_message(user_id, msg)
 
-        async def handle_message():
-            if user_id == self.cls.user_id:
-                return
-
-            cur_key_idx, key = self.av.key
+        if user_id == self.cls.user_id:
+            return
 
-            if (int.from_bytes(msg[:4], 'big') != cur_key_idx):
-                return
-            data = msg[4:]
+        key = self.av.find_key(msg[:4])
+        if key is None:
+            return
+        data = msg[4:]
 
-            data = self.av.encryption.decrypt(data, key)
+        data = self.av.encryption.decrypt(data, key)
 
-            self.stream.write(
-                data, num_frames=self.av.frames_per_buffer,
-                exception_on_underflow=False)
+        self.stream.write(
+            data, num_frames=self.av.frames_per_buffer,
+            exception_on_underflow=False)
 
-        asyncio.run(handle_message())
+    def on_disconnect(self):
+        self.capture_timer.cancel()
+        if self.input_stream is not None:
+            self.input_stream.close()
+            self.captured.put(None)
+        self.stream.close()
+        self.audio.terminate()
 
 # endregion
 
@@ -184,65 +220,172 @@ class VideoClientNamespace(AVClientNamespace):
 
     def on_connect(self):
         super().on_connect()
-        inpipe = ffmpeg.input('pipe:')
-        self.output = ffmpeg.output(
-            inpipe, 'pipe:', format='rawvideo', pix_fmt='rgbx')
+        self.streaming = True
+        self.decoders = {}
+        self.latest_frame = None
 
         async def send_video():
             await asyncio.sleep(2)
-            cap = cv2.VideoCapture(0)
+            Thread(target=self.grab_frames, daemon=True).start()
 
             inpipe = ffmpeg.input(
                 'pipe:',
                 format='rawvideo',
-                pix_fmt='rgbx',
+                pix_fmt='bgr24',
                 s='{}x{}'.format(
                     self.av.video_shape[1], self.av.video_shape[0]),
                 r=self.av.frame_rate,
             )
 
+            # One long-lived encoder for the whole call; spawning ffmpeg and
+            # reinitialising the codec per frame cost far more than the
+            # encode. Raw H.264 is self-delimiting, so chunks can be sent as
+            # they are
+            vcodec = pick_h264_encoder()
             output = ffmpeg.output(
-                inpipe, 'pipe:', vcodec='libx264', f='ismv',
-                preset='ultrafast', tune='zerolatency')
-
-            while True:
-                cur_key_idx, key = self.av.key
-
-                _, image = cap.read()
-                image = cv2.resize(
-                    image, (self.av.video_shape[1], self.av.video_shape[0]))
-                data = image.tobytes("hex", "rgb")
-
-                data = output.run(
-                    input=data, capture_stdout=True, quiet=True)[0]
-
-                data = self.av.encryption.encrypt(data, key)
-                self.send(cur_key_idx.to_bytes(4, 'big') + data)
+                inpipe, 'pipe:', vcodec=vcodec, f='h264',
+                **H264_ENCODERS[vcodec]
+            ).global_args('-loglevel', 'error')
+            self.encoder = ffmpeg.run_async(
+                output, pipe_stdin=True, pipe_stdout=True)
+            Thread(target=self.send_encoded, args=(self.encoder,),
+                   daemon=True).start()
+
+            # Resize writes into this buffer in place instead of allocating
+            # a new frame every iteration; ffmpeg reads the resized frame
+            # through a flat view rather than a bytes copy
+            frame = np.empty(self.av.video_shape, dtype=np.uint8)
+            frame_view = memoryview(frame).cast('B')
+            sent = None
+
+            while self.streaming:
+                image = self.latest_frame
+                if image is None or image is sent:
+                    await asyncio.sleep(1 / self.av.frame_rate / 5)
+                    continue
+                sent = image
+
+                cv2.resize(
+                    image, (self.av.video_shape[1], self.av.video_shape[0]),
+                    dst=frame)
+
+                self.encoder.stdin.write(frame_view)
+                self.encoder.stdin.flush()
 
                 await asyncio.sleep(1 / self.av.frame_rate / 5)
 
+            self.encoder.stdin.close()
+            self.encoder.wait()
+
         Thread(target=asyncio.run, args=(send_video(),)).start()
 
+    def grab_frames(self):
+        """Publishes camera frames to `latest_frame` as they arrive, so the
+        send loop never blocks on the capture driver."""
+        cap = cv2.VideoCapture(0)
+        if not cap.isOpened():
+            logger.error("Unable to open camera; not capturing video.")
+            cap.release()
+            return
+        # Keep the driver from queueing stale frames behind the newest one
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        while self.streaming:
+            ok, image = cap.read()
+            if ok:
+                self.latest_frame = image
+            elif not cap.isOpened():
+                logger.error("Camera disconnected; stopping video capture.")
+                break
+            else:
+                # A failed read returns at once; don't spin on it
+                sleep(1 / self.av.frame_rate)
+        cap.release()
+
+    def read_encoded(self, encoder, chunks):
+        """Queues encoder output as it arrives, then None once it exits."""
+        while chunk := encoder.stdout.read1(1 << 16):
+            chunks.put(chunk)
+        chunks.put(None)
+
+    def send_encoded(self, encoder):
+        """Encrypts and sends encoder output until the encoder exits.
+
+        A frame's NAL units often leave the encoder in several writes, so
+        chunks arriving within `video_batch_window` of the first (up to
+        `video_batch_bytes`) go out as one message. The H.264 stream is
+        self-delimiting, so the receiver needs no framing to split them.
+        """
+        chunks = SimpleQueue()
+        Thread(target=self.read_encoded, args=(encoder, chunks),
+               daemon=True).start()
+
+        done = False
+        while not done and (chunk := chunks.get()) is not None:
+            batch = [chunk]
+            size = len(chunk)
+            deadline = monotonic() + self.av.video_batch_window
+            while size < self.av.video_batch_bytes:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    chunk = chunks.get(timeout=remaining)
+                except Empty:
+                    break
+                if chunk is None:
+                    done = True
+                    break
+                batch.append(chunk)
+                size += len(chunk)
+
+            header, key = self.av.key
+            data = self.av.encryption.encrypt(b''.join(batch), key)
+            self.send(header + data)
+
+    def start_decoder(self, user_id):
+        """Starts a persistent H.264 decoder for `user_id` and a thread that
+        forwards its decoded RGBX frames to the frontend."""
+        decoder = ffmpeg.run_async(
+            ffmpeg.output(
+                ffmpeg.input('pipe:', format='h264'),
+                'pipe:', format='rawvideo', pix_fmt='rgb0'
+            ).global_args('-loglevel', 'error'),
+            pipe_stdin=True, pipe_stdout=True)
+        self.decoders[user_id] = decoder
+
+        def emit_frames():
+            height, width, _ = self.av.video_shape
+            frame_size = height * width * 4
+            # Each frame must be its own bytes object: socketio only sends
+            # bytes as binary, and may still hold a frame after emit returns
+            while len(frame := decoder.stdout.read(frame_size)) == frame_size:
+                self.frontend_socket.emit('stream', frame)
+
+        Thread(target=emit_frames, daemon=True).start()
+        return decoder
+
     def on_message(self, user_id, msg):
         super().on_message(user_id, msg)
 
-        async def handle_message():
-            if user_id == self.cls.user_id:
-                return
-            cur_key_idx, key = self.av.key
+        if user_id == self.cls.user_id:
+            return
+        key = self.av.find_key(msg[:4])
+        if key is None:
+            return
 
-            if (int.from_bytes(msg[:4], 'big') != cur_key_idx):
-                return
+        data = self.av.encryption.decrypt(msg[4:], key)
 
-            data = self.av.encryption.decrypt(msg[4:], key)
+        decoder = self.decoders.get(user_id) or self.start_decoder(user_id)
+        decoder.stdin.write(data)
+        decoder.stdin.flush()
 
-            # Data is now an ISMV format file in memory
-            data = self.output.run(input=data, capture_stdout=True,
-                                   quiet=True)[0]
-
-            super().frontend_socket.emit(data, {'type': 'stream'})
-
-        asyncio.run(handle_message())
+    def on_disconnect(self):
+        # The send loop shuts its own encoder down once it sees this
+        self.streaming = False
+        for decoder in self.decoders.values():
+            decoder.stdin.close()
+            decoder.wait()
+        self.decoders.clear()
 
 # endregion
 
@@ -252,8 +395,6 @@ class VideoClientNamespace(AVClientNamespace):
 
 class AV:
     namespaces = {
-        # '/video_key'    : (BroadcastFlaskNamespace, KeyClientNamespace),
-        # '/audio_key'    : (BroadcastFlaskNamespace, KeyClientNamespace),
         '/video': (BroadcastFlaskNamespace, VideoClientNamespace),
         '/audio': (BroadcastFlaskNamespace, AudioClientNamespace),
     }
@@ -272,29 +413,62 @@ class AV:
                         (480, 640, 3), (720, 960, 3), (1080, 1920, 3)]
         self.video_shape = video_shapes[2]
         self.frame_rate = 15
+        self.video_batch_bytes = 1 << 15
+        self.video_batch_window = 0.008  # seconds
 
         sample_rates = [8196, 44100]
         self.sample_rate = sample_rates[0]
         self.frames_per_buffer = self.sample_rate // 6
-        self.audio_wait = 1 / 8
 
-        self.key = self.key_gen.get_key().tobytes()
+        # Recent (header, key) pairs, so frames sealed just before a rotation
+        # still decrypt on arrival instead of being dropped. The header is
+        # the key index packed once per rotation rather than once per frame
+        self.key_buffer_size = 4
+        self.keys = deque(maxlen=self.key_buffer_size)
+        self.key = _HDR.pack(0), self.key_gen.get_key()
+        self.keys.append(self.key)
+        self.last_found = self.key
 
         self.encryption: EncryptSchemes.ABSTRACT = encryption
 
         self.client_namespaces = generate_client_namespace(
             cls, self, frontend_socket)
 
-        async def gen_keys():
-            key_idx = 0
-            while True:
-                self.key_gen.generate_key(key_length=128)
-                self.key = key_idx, self.key_gen.get_key().tobytes()
-                key_idx += 1
+        self.stopped = Event()
+        Thread(target=self.rotate_keys, daemon=True).start()
 
-                await asyncio.sleep(1)
-
-        Thread(target=asyncio.run, args=(gen_keys(),)).start()
+    def rotate_keys(self):
+        """Switches to a new key every second until `close` is called."""
+        key_idx = 1
+        # Each key is generated ahead of its epoch, so a rotation is just a
+        # tuple swap rather than key generation at the moment of switching
+        self.key_gen.generate_key(key_length=128)
+        next_key = self.key_gen.get_key()
+        while not self.stopped.wait(1):
+            self.key = _HDR.pack(key_idx), next_key
+            self.keys.append(self.key)
+            key_idx += 1
+
+            self.key_gen.generate_key(key_length=128)
+            next_key = self.key_gen.get_key()
+
+    def close(self):
+        self.stopped.set()
+
+    def find_key(self, header):
+        """Returns the buffered key for the 4-byte `header`, or None if it
+        has already been rotated out."""
+        # Every frame within a key epoch carries the same header, so check
+        # the last match before scanning the buffer
+        last_header, last_key = self.last_found
+        if last_header == header:
+            return last_key
+        # rotate_keys appends from another thread, so scan a snapshot
+        for key_header, key in reversed(tuple(self.keys)):
+            if key_header == header:
+                self.last_found = key_header, key
+                return key
+        return None
 
 # endregion
 
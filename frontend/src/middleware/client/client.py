@@ -1,31 +1,45 @@
 import requests
 import socketio
 
+from requests.adapters import HTTPAdapter
+from threading import Event
+
 from client.api import ClientAPI
 from client.av import AV
 from client.endpoint import Endpoint
 from client.errors import Errors
-from client.util import get_parameters, ClientState
+from client.util import get_parameters, ClientState, WEBSOCKET_OPTIONS
 from custom_logging import logger
 
+PEER_CONNECT_TIMEOUT = 10  # seconds
+HTTP_TIMEOUT = 5  # seconds
+
 # TODO: Trim down this file
 # region --- Socket Client ---
 
 
 class SocketClient():  # Not threaded because sio.connect() is not blocking
 
-    sio = socketio.Client()
-    user_id = None
-    endpoint = None
-    instance = None
-    namespaces = None
-    av = None
-    video = {}
-    display_message = None
+    def __init__(self, endpoint, user_id,
+                 display_message, frontend_socket):
+        logger.info(
+            f"Initiailizing Socket Client with WebSocket endpoint {endpoint}.")
+
+        self.sio = socketio.Client(websocket_extra_options=WEBSOCKET_OPTIONS)
+        self.endpoint = Endpoint.of(endpoint)
+        self.user_id = user_id
+        self.display_message = display_message
+        self.video = {}
+        self.connected = Event()  # Set once the Socket.IO 'connect' event fires
 
-    @classmethod
-    def is_connected(cls):
-        return cls.sio.connected
+        self.av = AV(self, frontend_socket)
+        self.namespaces = self.av.client_namespaces
+
+        self.sio.on('connect', self.on_connect)
+        self.sio.on('message', self.on_message)
+
+    def is_connected(self):
+        return self.sio.connected
 
     def HandleExceptions(endpoint_handler):
         """
@@ -34,11 +48,9 @@ class SocketClient():  # Not threaded because sio.connect() is not blocking
 
         NOTE: This should never be called explicitly
         """
-        def handler_with_exceptions(*args, **kwargs):
-            cls = SocketClient
-
+        def handler_with_exceptions(self, *args, **kwargs):
             try:
-                return endpoint_handler(cls, *args, **kwargs)
+                return endpoint_handler(self, *args, **kwargs)
             except Exception as e:  # TODO: Add excpetions
                 raise e
         return handler_with_exceptions
@@ -46,74 +58,56 @@ class SocketClient():  # Not threaded because sio.connect() is not blocking
 
     # region --- External Interface ---
 
-    @classmethod
-    # TODO: Unsure if client needed.
-    def init(cls, endpoint, user_id,
-             display_message, frontend_socket):
-        logger.info(
-            f"Initiailizing Socket Client with WebSocket endpoint {endpoint}.")
-
-        cls.av = AV(cls, frontend_socket)
-        cls.namespaces = cls.av.client_namespaces
-        cls.endpoint = Endpoint(*endpoint)
-        cls.user_id = user_id
-        cls.display_message = display_message
-        cls.instance = cls()
-        return cls.instance
-
     def start(self):
         self.run()
 
     def run(self):
-        SocketClient.connect()
+        self.connect()
 
-    @classmethod
-    def send_message(cls, msg: str, namespace='/'):
-        cls.sio.send(((str(cls.user_id), ), msg),
-                     namespace=namespace)
+    def send_message(self, msg: str, namespace='/'):
+        self.sio.send(((str(self.user_id), ), msg),
+                      namespace=namespace)
 
-    @classmethod
-    def connect(cls):
-        logger.info(f"Attempting WebSocket connection to {cls.endpoint}.")
+    def connect(self):
+        logger.info(f"Attempting WebSocket connection to {self.endpoint}.")
         try:
-            ns = sorted(list(cls.namespaces.keys()))
-            cls.sio.connect(str(cls.endpoint), wait_timeout=5, auth=(
-                cls.user_id), namespaces=['/'] + ns)
+            ns = sorted(list(self.namespaces.keys()))
+            self.sio.connect(str(self.endpoint), wait_timeout=5, auth=(
+                self.user_id), namespaces=['/'] + ns)
             for name in ns:
-                cls.sio.register_namespace(cls.namespaces[name])
+                self.sio.register_namespace(self.namespaces[name])
         except socketio.exceptions.ConnectionError as e:
             logger.error(f"Connection failed: {str(e)}")
 
-    @classmethod
-    def disconnect(cls):
+    def disconnect(self):
         # Check to make sure we're actually connected
         logger.info("Disconnecting Socket Client from Websocket API.")
-        cls.sio.disconnect()
+        self.sio.disconnect()
+        self.connected.clear()
+        self.av.close()
         # Make sure to update state, delete instance if necessary, etc.
 
-    @classmethod
-    def kill(cls):
+    def kill(self):
         logger.info("Killing Socket Client")
-        cls.disconnect()
+        self.disconnect()
         # Make sure to update state, delete instance if necessary, etc.
     # endregion
 
     # region --- Event Endpoints ---
 
-    @sio.on('connect')
     @HandleExceptions
-    def on_connect(cls):
+    def on_connect(self):
         logger.info(f"Socket connection established to endpoint {
-                        SocketClient.endpoint}")
-        ns = sorted(list(cls.namespaces.keys()))
+                        self.endpoint}")
+        ns = sorted(list(self.namespaces.keys()))
         for name in ns:
-            cls.namespaces[name].on_connect()
+            self.namespaces[name].on_connect()
+        self.connected.set()
 
-    @sio.on('message')
     @HandleExceptions
-    def on_message(cls, user_id, msg):
+    def on_message(self, user_id, msg):
         logger.info(f"Received message from user {user_id}: {msg}")
-        SocketClient.display_message(user_id, msg)
+        self.display_message(user_id, msg)
 
     # endregion
 # endregion
@@ -139,6 +133,12 @@ class Client:
         self.api_instance = None
         self.websocket_instance = None
 
+        # Pooled keep-alive connections to the server; urllib3 already sets
+        # TCP_NODELAY on the sockets it opens
+        self.http = requests.Session()
+        self.http.mount('http://', HTTPAdapter(pool_connections=4,
+                                               pool_maxsize=8))
+
         self.gui = None
         self.start_api()
         self.connect()
@@ -152,7 +152,7 @@ class Client:
             raise Errors.INTERNALCLIENTERROR.value(
                 "Cannot change server endpoint after connection already established.")
 
-        self.server_endpoint = Endpoint(*endpoint)
+        self.server_endpoint = Endpoint.of(endpoint)
         logger.info(f"Setting server endpoint: {self.server_endpoint}")
 
     def set_api_endpoint(self, endpoint):
@@ -161,7 +161,7 @@ class Client:
             raise Errors.INTERNALCLIENTERROR.value(
                 "Cannot change API endpoint after connection already established.")
 
-        self.api_endpoint = Endpoint(*endpoint)
+        self.api_endpoint = Endpoint.of(endpoint)
         ClientAPI.endpoint = self.api_endpoint
         logger.info(f"Setting API endpoint: {self.api_endpoint}")
 
@@ -174,8 +174,10 @@ class Client:
         logger.info(f"Contacting Server at {endpoint}.")
 
         try:
-            response = requests.post(str(endpoint), json=json)
-        except requests.exceptions.ConnectionError as e:
+            response = self.http.post(str(endpoint), json=json,
+                                      timeout=HTTP_TIMEOUT)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
             raise Errors.CONNECTIONREFUSED.value(
                 f"Unable to reach Server API at endpoint {endpoint}.")
 
@@ -198,15 +200,16 @@ class Client:
         except Exception:
             pass
         try:
-            SocketClient.kill()
+            self.websocket_instance.kill()
         except Exception:
             pass
         try:
-            requests.delete(str(self.server_endpoint('/remove_user')), json={
+            self.http.delete(str(self.server_endpoint('/remove_user')), json={
                 'user_id': self.user_id
-            })
+            }, timeout=HTTP_TIMEOUT)
         except Exception:
             pass
+        self.http.close()
         # TODO: Kill Socket Client
         # TODO: Kill Socket API
         # TODO: Kill Client API
@@ -279,9 +282,12 @@ class Client:
         logger.info(f"Received websocket endpoint '{
             websocket_endpoint}'.")
         self.connect_to_websocket(websocket_endpoint)
-        while True:
-            if SocketClient.is_connected():
-                break
+        if not self.websocket_instance.connected.wait(
+                timeout=PEER_CONNECT_TIMEOUT):
+            context = f"Timed out connecting to websocket at {
+                websocket_endpoint}."
+            logger.error(context)
+            raise Errors.CONNECTIONREFUSED.value(context)
 
     def disconnect_from_server(self):
         pass
@@ -310,7 +316,7 @@ class Client:
         """
         if self.state == ClientState.CONNECTED:
             raise Errors.INTERNALCLIENTERROR.value(
-                f"Cannot attempt peer websocket connection while {self.state}.")
+                f"Cannot attempt peer websocket connection while {self.state.name}.")
 
         logger.info("Polling User")
         print(f"Incoming connection request from {peer_id}.")
@@ -332,11 +338,11 @@ class Client:
 
     # region --- Web Socket Interface ---
     def connect_to_websocket(self, endpoint):
-        sio = SocketClient.init(
+        self.websocket_instance = SocketClient(
             endpoint, self.user_id,
             self.display_message, self.frontend_socket)
         try:
-            sio.start()
+            self.websocket_instance.start()
         except Exception as e:
             logger.error(f"Failed to connect to WebSocket at {endpoint}.")
             raise e
@@ -1,10 +1,11 @@
 import os
 import string
+import numpy as np
 from abc import ABC, abstractmethod
 from bitarray import bitarray
 from enum import Enum
 from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
+from Crypto.Random import get_random_bytes
 
 # Encryption Schemes
 
@@ -26,24 +27,32 @@ class AbstractEncryptionScheme(ABC):
         pass
 
 
+def xor_bytes(data, key):
+    """
+    XORs `data` with `key`, truncated to the shorter of the two.
+    Works eight bytes at a time on uint64 views; the < 8 byte tail
+    is handled separately.
+    """
+    n = min(len(data), len(key))
+    words = n // 8
+    head = np.bitwise_xor(np.frombuffer(data, dtype=np.uint64, count=words),
+                          np.frombuffer(key, dtype=np.uint64, count=words))
+    tail = bytes(a ^ b for a, b in zip(data[words * 8:n], key[words * 8:n]))
+    return head.tobytes() + tail
+
+
 class XOREncryption(AbstractEncryptionScheme):
 
     def __init__(self):
         self.name = "XOR"
 
-    # data and key are bit arrays with same length
+    # data and key are bytes with same length
     def encrypt(self, data, key):
-        result = bitarray()
-        for bit1, bit2 in zip(data, key):
-            result.append(bit1 ^ bit2)
-        return result
+        return xor_bytes(data, key)
 
-    # data and key are bit arrays with same length
+    # data and key are bytes with same length
     def decrypt(self, data, key):
-        result = bitarray()
-        for bit1, bit2 in zip(data, key):
-            result.append(bit1 ^ bit2)
-        return result
+        return xor_bytes(data, key)
 
     def get_name(self):
         return self.name
@@ -63,31 +72,32 @@ class DebugEncryption(AbstractEncryptionScheme):
         return self.name
 
 
+NONCE_SIZE = 12  # 96-bit nonces skip the extra GHASH pass in GCM
+TAG_SIZE = 16
+
+
 class AESEncryption(AbstractEncryptionScheme):
     def __init__(self, bits=128):
         self.bits = bits
         self.name = f"AES-{bits}"
         self.results = []
 
-    # data and key are bit arrays
-    # using AES-CBC
+    # data and key are bytes
+    # using AES-GCM; output is nonce + tag + ciphertext
     def encrypt(self, data, key):
-        cipher = AES.new(key, AES.MODE_CBC, iv=b'0' * 16)
-        data = pad(data, AES.block_size)
-        cipheredData = cipher.encrypt(data)
-        result_data = cipheredData
-        return result_data
-
-    # data and key are bit arrays
-    # data contains iv and encrypted data
+        cipher = AES.new(key, AES.MODE_GCM,
+                         nonce=get_random_bytes(NONCE_SIZE))
+        cipheredData, tag = cipher.encrypt_and_digest(data)
+        return cipher.nonce + tag + cipheredData
+
+    # data and key are bytes
+    # data contains nonce, tag and encrypted data
     def decrypt(self, data, key):
-        iv = b'0' * 16
-        cipheredData = data
-        cipher = AES.new(key, AES.MODE_CBC, iv)
-        decrypted = cipher.decrypt(cipheredData)
-        decrypted = unpad(decrypted, AES.block_size)
-        result = decrypted
-        return result
+        nonce = data[:NONCE_SIZE]
+        tag = data[NONCE_SIZE:NONCE_SIZE + TAG_SIZE]
+        cipheredData = data[NONCE_SIZE + TAG_SIZE:]
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        return cipher.decrypt_and_verify(cipheredData, tag)
 
     def get_name(self):
         return self.name
@@ -128,6 +138,9 @@ class AbstractKeyGenerator(ABC):
         pass
 
 
+DEBUG_KEY_BYTE = b'\x55'  # 0b01010101
+
+
 class DebugKeyGenerator(AbstractKeyGenerator):
     def __init__(self):
         self.key: bitarray = bitarray()
@@ -136,7 +149,9 @@ class DebugKeyGenerator(AbstractKeyGenerator):
     def speficied_keylength(self, length):
         self.key_length = length
         # Default debug key is alternating 1 and 0
-        self.key = bitarray([i % 2 for i in range(self.key_length)])
+        self.key = bitarray()
+        self.key.frombytes(DEBUG_KEY_BYTE * ((self.key_length + 7) // 8))
+        del self.key[self.key_length:]
 
     def specified_key(self, key):
         bit_array = bitarray()
@@ -161,22 +176,20 @@ class DebugKeyGenerator(AbstractKeyGenerator):
             raise ValueError("Invalid parameters")
 
     def get_key(self):
-        return self.key
+        return self.key.tobytes()
 
 
 class RandomKeyGenerator(AbstractKeyGenerator):
     def __init__(self, key_length=0):
         self.key_length = key_length
-        self.key: bitarray = None
+        self.key: bytes = None
 
     def generate_key(self, key_length=0):
         if key_length:
             self.key_length = key_length
         elif self.key_length < 1:
             raise ValueError("Error, please make key length nonzero")
-        self.key = bitarray([int(b) for b in format(int.from_bytes(os.urandom(
-            (self.key_length + 7) // 8), 'big'),
-            f'0{self.key_length}b')[:self.key_length]])
+        self.key = os.urandom((self.key_length + 7) // 8)
 
     def get_key(self):
         return self.key
@@ -188,7 +201,7 @@ class FileKeyGenerator(AbstractKeyGenerator):
                  file_name=os.path.dirname(__file__) + "/key.bin",
                  key_length=0):
         self.key_length = key_length
-        self.key: bitarray = None
+        self.key: bytes = None
         self.file_name = file_name
         self.file = open(self.file_name, "rb")
 
@@ -197,8 +210,7 @@ class FileKeyGenerator(AbstractKeyGenerator):
             self.key_length = key_length
         elif self.key_length < 1:
             raise ValueError("Error, please make key length nonzero")
-        self.key = bitarray()
-        self.key.frombytes(self.file.read((key_length + 7) // 8))
+        self.key = self.file.read((key_length + 7) // 8)
 
     def get_key(self):
         return self.key
@@ -1,4 +1,6 @@
 class Endpoint:
+    __slots__ = ('ip', 'port', 'route', '_str')
+
     def __init__(self, ip: str, port: int, route: str = None):
         if not ip:
             self.ip = None
@@ -20,12 +22,21 @@ class Endpoint:
         else:
             self.route = route
 
+        # Endpoints are not modified after construction, so format once
+        self._str = self.to_string()
+
     def __call__(self, route: str):
         if not route:
             return self
-        endpoint = Endpoint(*self)
-        endpoint.route = route
-        return Endpoint(*endpoint)  # Re-instantiating fixes slashes in `route`
+        return Endpoint(self.ip, self.port, route)  # __init__ fixes slashes
+
+    @classmethod
+    def of(cls, endpoint):
+        """Returns `endpoint` as an Endpoint; Endpoints are immutable, so an
+        existing one is returned as-is rather than copied."""
+        if isinstance(endpoint, Endpoint):
+            return endpoint
+        return cls(*endpoint)
 
     def to_string(self):
         ip = self.ip if self.ip else 'localhost'
@@ -34,13 +45,13 @@ class Endpoint:
         return f"http://{ip}{port}{route}"
 
     def __str__(self):
-        return self.to_string()
+        return self._str
 
     def __repr__(self):
-        return self.to_string()
+        return self._str
 
     def __unicode__(self):
-        return self.to_string()
+        return self._str
 
     def __iter__(self):
         yield self.ip if self.ip else 'localhost'
@@ -1,21 +1,25 @@
-from enum import Enum
-from functools import total_ordering
+import socket
+import sys
+from enum import IntEnum
 from typing import Callable, Union
 from client.errors import Errors
 
 
-@total_ordering
-class ClientState(Enum):
-    NEW = 'NEW'  # Uninitialized
-    INIT = 'INIT'  # Initialized
-    LIVE = 'LIVE'  # Connected to server
-    CONNECTED = 'CONNECTED'  # Connected to peer
+class ClientState(IntEnum):  # Ordered so states compare as plain ints
+    NEW = 0  # Uninitialized
+    INIT = 1  # Initialized
+    LIVE = 2  # Connected to server
+    CONNECTED = 3  # Connected to peer
 
-    def __lt__(self, other):
-        if self.__class__ is other.__class__:
-            arr = list(self.__class__)
-            return arr.index(self) < arr.index(other)
-        return NotImplemented
+
+SOCKET_BUFFER_SIZE = 1 << 20  # 1 MiB
+
+# Passed as `websocket_extra_options` to socketio.Client so the WebSocket
+# transport's TCP socket is created with these options
+WEBSOCKET_OPTIONS = {
+    'sockopt': ((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+                (socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)),
+}
 
 
 def display_message(user_id, msg):
@@ -56,7 +60,7 @@ def get_parameters(data: Union[list, tuple, dict], *args: Union[list, str, tuple
             raise Errors.PARAMETERERROR.value(
                 f"Expected {len(validators)} parameters but received {len(data)}.")
 
-        param_vals = ()
+        param_vals = []
         for param, validator in zip(data, validators):
             if not validator:
                 validator = lambda x: not not x
@@ -64,8 +68,8 @@ def get_parameters(data: Union[list, tuple, dict], *args: Union[list, str, tuple
             if not validator(param):
                 raise Errors.INVALIDPARAMETER.value(
                     "Parameter failed validation.")
-            param_vals += (*param_vals, param)
-        return param_vals
+            param_vals.append(param)
+        return tuple(param_vals)
 
     def get_from_dict(data: dict, *args: Union[str, tuple[str, callable], None]):
         """
@@ -79,7 +83,8 @@ def get_parameters(data: Union[list, tuple, dict], *args: Union[list, str, tuple
             Key of desired data
         arg : tuple(str, func), optional
         """
-        param_vals = ()
+        missing = object()
+        param_vals = []
         for arg in args:
             if isinstance(arg, tuple):
                 param, validator = arg
@@ -88,9 +93,8 @@ def get_parameters(data: Union[list, tuple, dict], *args: Union[list, str, tuple
                 # Truthy/Falsy coersion to bool
                 validator = lambda x: not not x
 
-            if param in data:
-                param_val = data.get(param)
-            else:
+            param_val = data.get(param, missing)
+            if param_val is missing:
                 raise Errors.PARAMETERERROR.value(
                     f"Expected parameter '{param}' not received.")
 
@@ -98,10 +102,44 @@ def get_parameters(data: Union[list, tuple, dict], *args: Union[list, str, tuple
                 raise Errors.INVALIDPARAMETER.value(
                     f"Parameter '{param}' failed validation.")
 
-            param_vals = (*param_vals, param_val)
-        return param_vals
+            param_vals.append(param_val)
+        return tuple(param_vals)
 
     if isinstance(data, list) or isinstance(data, tuple):
-        return get_from_iterable(data, args if len(args == 0) else args[0])
+        return get_from_iterable(data, args if len(args) == 0 else args[0])
     if isinstance(data, dict):
         return get_from_dict(data, *args)
+
+
+def configure_socket(sock):
+    """
+    Tunes a TCP socket for low-latency streaming: disables Nagle's algorithm
+    and raises the kernel send/receive buffers to `SOCKET_BUFFER_SIZE`.
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+
+
+def create_listener(address, backlog=128):
+    """
+    Returns a bound, listening TCP socket at `address` configured with
+    `configure_socket`. Accepted connections inherit these options.
+    Raises OSError if the address is in use.
+
+    Parameters
+    ----------
+    address : tuple(str, int)
+    backlog : int, optional
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        if sys.platform != 'win32':
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        configure_socket(sock)
+        sock.bind(address)
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return sock
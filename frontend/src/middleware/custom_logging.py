@@ -1,6 +1,9 @@
+import atexit
 import os
 from logging import Formatter, getLogger, DEBUG, INFO, StreamHandler, FileHandler
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
+from queue import SimpleQueue
 
 
 now = datetime.now()
@@ -40,13 +43,17 @@ stream_handler = StreamHandler()
 stream_handler.setLevel(INFO)
 stream_handler.setFormatter(formatter)
 
-# Add the handlers to the logger
-logger.addHandler(stream_handler)
-
 # Create file handler which logs debug messages and set formatter
 file_handler = FileHandler(log_file_path, mode='a')  # append mode
 file_handler.setLevel(DEBUG)
 file_handler.setFormatter(formatter)
 
-# Add the file handler to the logger
-logger.addHandler(file_handler)
+# The logger only enqueues records; a background listener does the console
+# and file writes so the audio/video threads never block on I/O
+log_queue = SimpleQueue()
+logger.addHandler(QueueHandler(log_queue))
+
+listener = QueueListener(log_queue, stream_handler, file_handler,
+                         respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
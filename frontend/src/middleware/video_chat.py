@@ -5,6 +5,7 @@ import sys
 from client.client import Client
 from client.api import ClientAPI
 from client.endpoint import Endpoint
+from client.util import WEBSOCKET_OPTIONS
 from custom_logging import logger
 
 DEV = True
@@ -15,7 +16,8 @@ if __name__ == "__main__":
         config = json.load(json_data)
 
     try:
-        frontend_socket = socketio.Client()
+        frontend_socket = socketio.Client(
+            websocket_extra_options=WEBSOCKET_OPTIONS)
         logger.info('Initializing client')
         client = Client(frontend_socket,
                         api_endpoint=ClientAPI.DEFAULT_ENDPOINT,
@@ -38,8 +40,9 @@ if __name__ == "__main__":
             logger.info(f'Received peer id {data} from frontend')
             client.connect_to_peer(data)
 
-        while True:
-            pass
+        # Block on the Socket.IO client's own background thread rather than
+        # spinning a core
+        frontend_socket.wait()
 
     except Exception as f:
         raise f
@@ -1,30 +1,67 @@
+# Patch the stdlib before anything imports sockets (requests in particular),
+# so outbound calls to clients yield to other greenlets instead of blocking
+# the WSGI server's hub
+from gevent import monkey
+monkey.patch_all()
+
 from threading import Thread
 from flask_socketio import SocketIO, send
 from utils.av import generate_flask_namespace
 from utils import Endpoint
-from functools import total_ordering
+from functools import lru_cache, total_ordering, wraps
 from enum import Enum
 from utils import ServerError, BadGateway, BadRequest, ParameterError, InvalidParameter, BadAuthentication
 from utils import remove_last_period
-import logging
+from utils import create_listener
+from custom_logging import logger
 from server import Server
 from gevent.pywsgi import WSGIServer  # For asynchronous handling
 from flask import Flask, jsonify, request
+import os
 import psutil
 import platform
+import socket
+import sys
 key = 'WiFi 2' if platform.system() == 'Windows' else 'en11' #TODO: add support for ad hoc and wifi without manually changing
 
-for prop in psutil.net_if_addrs()[key]:
-    if prop.family == 2:
-        ip = prop.address
 
+@lru_cache(maxsize=1)
+def _detect_ip():
+    """
+    Returns the IPv4 address the server binds to: `SERVER_IP` from the
+    environment if set, otherwise the first IPv4 address on interface `key`.
+    """
+    override = os.environ.get('SERVER_IP')
+    if override:
+        return override
+    for prop in psutil.net_if_addrs()[key]:
+        if prop.family == socket.AF_INET:
+            return prop.address
+
+
+ip = _detect_ip()
 
-# region --- Logging --- # TODO: Add internal logger to API class
-logging.basicConfig(filename='./logs/api.log', level=logging.DEBUG,
-                    format='[%(asctime)s] (%(levelname)s) %(name)s.%(funcName)s: %(message)s',
-                    datefmt='%H:%M:%S')
-logger = logging.getLogger(__name__)
-# endregion
+PORT_SEARCH_LIMIT = 100  # ports tried after the configured one is taken
+
+
+def _pick_open_port(ip, start):
+    """
+    Returns the first port from `start` up that `ip` can bind, binding the
+    way the listener will (SO_REUSEADDR off Windows) so ports held only by
+    TIME_WAIT connections still count as free. Raises ServerError if none
+    of the next `PORT_SEARCH_LIMIT` ports are.
+    """
+    stop = min(start + PORT_SEARCH_LIMIT, 65536)
+    for port in range(start, stop):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            if sys.platform != 'win32':
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                s.bind((ip, port))
+                return port
+            except OSError:
+                continue
+    raise ServerError(f"No open port on {ip} in {start}-{stop - 1}.")
 
 
 # region --- Utils ---
@@ -45,11 +82,24 @@ class SocketState(Enum):
 
     def __lt__(self, other):
         if self.__class__ is other.__class__:
-            arr = list(self.__class__)
-            return arr.index(self) < arr.index(other)
+            return self._ord < other._ord
         return NotImplemented
 
 
+# Definition order, cached so comparisons don't rebuild the member list
+for _ord, _state in enumerate(SocketState):
+    _state._ord = _ord
+del _ord, _state
+
+
+_MISSING = object()
+
+
+def _accept(_):
+    """Default validator: accepts any value."""
+    return True
+
+
 def get_parameters(data, *args):
     """
     Returns desired parameters from a collection with optional data validation.
@@ -68,7 +118,7 @@ def get_parameters(data, *args):
         arg[1] : func
     """
     if isinstance(data, list) or isinstance(data, tuple):
-        if len(args == 0):
+        if len(args) == 0:
             return get_parameters_from_sequence(data)
         return get_parameters_from_sequence(data, args[0])
     if isinstance(data, dict):
@@ -94,17 +144,12 @@ def get_parameters_from_sequence(data, validators=[]):
         raise ParameterError(
             f"Expected {len(validators)} parameters but received {len(data)}.")
 
-    param_vals = ()
-    for i in range(len(data)):
-        param_val = data[i]
-        validator = validators[i]
-        if not validator:
-            validator = lambda x: True
-
-        if not validator(param_val):
+    param_vals = []
+    for i, (param_val, validator) in enumerate(zip(data, validators)):
+        if not (validator or _accept)(param_val):
             raise InvalidParameter(f"Parameter {i + 1} failed validation.")
-        param_vals += (*param_vals, param_val)
-    return param_vals
+        param_vals.append(param_val)
+    return tuple(param_vals)
 
 
 def get_parameters_from_dict(data, *args):
@@ -121,29 +166,72 @@ def get_parameters_from_dict(data, *args):
         arg[0] : str,
         arg[1] : func
     """
-    param_vals = ()
-    for i in range(len(args)):
-        arg = args[i]
-        validator = lambda x: True
+    param_vals = []
+    for arg in args:
+        validator = _accept
         if type(arg) is tuple:
             param, validator = arg
         else:
             param = arg
 
-        if param in data:
-            param_val = data.get(param)
-        else:
+        param_val = data.get(param, _MISSING)
+        if param_val is _MISSING:
             raise ParameterError(f"Expected parameter '{param}' not received.")
 
         if not validator(param_val):
             raise InvalidParameter(f"Parameter '{param}' failed validation.")
 
-        param_vals = (*param_vals, param_val)
-    return param_vals
+        param_vals.append(param_val)
+    return tuple(param_vals)
 
 
 def is_type(type_):
     return lambda x: isinstance(x, type_)
+
+
+def params(*args):
+    """
+    Decorator that extracts parameters from the request JSON and passes them
+    to the endpoint handler after `cls`. The spec is parsed once, here,
+    rather than on every request.
+
+    Parameters
+    ----------
+    arg : str
+        Key of desired data
+    arg : 2-tuple
+        arg[0] : str,
+        arg[1] : func
+    """
+    spec = tuple(arg if type(arg) is tuple else (arg, None) for arg in args)
+
+    def extract(data):
+        if not isinstance(data, dict):
+            raise ParameterError("Expected a JSON object of parameters.")
+        param_vals = []
+        for param, validator in spec:
+            param_val = data.get(param, _MISSING)
+            if param_val is _MISSING:
+                raise ParameterError(
+                    f"Expected parameter '{param}' not received.")
+            if validator is not None and not validator(param_val):
+                raise InvalidParameter(
+                    f"Parameter '{param}' failed validation.")
+            param_vals.append(param_val)
+        return param_vals
+
+    def decorator(endpoint_handler):
+        @wraps(endpoint_handler)
+        def handler_with_params(cls, *args, **kwargs):
+            return endpoint_handler(cls, *extract(request.json), *args, **kwargs)
+        return handler_with_params
+    return decorator
+
+
+def _err(code, message, e):
+    """Returns the JSON error response and status for exception `e`."""
+    return jsonify({"error_code": str(code), "error_message": message,
+                    "details": remove_last_period(e)}), code
 # endregion
 
 
@@ -160,7 +248,7 @@ class ServerAPI:  # TODO: Potentially, subclass Thread since server is blocking
     state = APIState.INIT
 
     # region --- Utils ---
-    logger = logging.getLogger('ServerAPI')
+    logger = logger.getChild('ServerAPI')
 
     def HandleExceptions(endpoint_handler):
         """Decorator to handle commonly encountered exceptions in the API"""
@@ -169,26 +257,26 @@ class ServerAPI:  # TODO: Potentially, subclass Thread since server is blocking
             try:
                 return endpoint_handler(cls, *args, **kwargs)
             except BadAuthentication as e:
-                cls.logger.info(f"Authentication failed for server at {
-                                endpoint_handler.__name__}:\n\t{str(e)}")
-                return jsonify({"error_code": "403", "error_message": "Forbidden", "details": remove_last_period(e)}), 403
+                cls.logger.info("Authentication failed for server at %s:\n\t%s",
+                                endpoint_handler.__name__, e)
+                return _err(403, "Forbidden", e)
             except BadRequest as e:
                 cls.logger.info(str(e))
-                return jsonify({"error_code": "400", "error_message": "Bad Request", "details": remove_last_period(e)}), 400
+                return _err(400, "Bad Request", e)
             except ServerError as e:
                 cls.logger.error(str(e))
-                return jsonify({"error_code": "500", "error_message": "Interal Server Error", "details": remove_last_period(e)}), 500
+                return _err(500, "Interal Server Error", e)
             except BadGateway as e:
                 cls.logger.info(str(e))
-                return jsonify({"error_code": "502", "error_message": "Bad Gateway", "details": remove_last_period(e)}), 502
+                return _err(502, "Bad Gateway", e)
         handler_with_exceptions.__name__ = endpoint_handler.__name__
         return handler_with_exceptions
     # endregion
 
     @classmethod
     def init(cls, server: Server):
-        cls.logger.info(f"Initializing Server API with endpoint {
-                        server.api_endpoint}.")
+        cls.logger.info("Initializing Server API with endpoint %s.",
+                        server.api_endpoint)
         if cls.state == APIState.LIVE:
             raise ServerError(f"Cannot reconfigure API during server runtime.")
         cls.server = server
@@ -197,14 +285,15 @@ class ServerAPI:  # TODO: Potentially, subclass Thread since server is blocking
 
     @classmethod
     def start(cls):
-        cls.logger.info(f"Starting Server API at {cls.endpoint}.")
+        cls.logger.info("Starting Server API at %s.", cls.endpoint)
         if cls.state == APIState.INIT:
             raise ServerError(f"Cannot start API before initialization.")
         if cls.state == APIState.LIVE:
             raise ServerError(f"Cannot start API: already running.")
 
         cls.state = APIState.LIVE
-        cls.http_server = WSGIServer(tuple(cls.endpoint), cls.app)
+        cls.http_server = WSGIServer(
+            create_listener(tuple(cls.endpoint)), cls.app)
         cls.http_server.serve_forever()
 
     @classmethod
@@ -231,13 +320,14 @@ class ServerAPI:  # TODO: Potentially, subclass Thread since server is blocking
 
         # api_endpoint = get_parameters(request.json, 'api_endpoint')
         user_id = server.add_user()
-        cls.logger.info(f"Created a user with ID: {user_id}")
+        cls.logger.info("Created a user with ID: %s", user_id)
 
         return jsonify({'user_id': user_id}), 200
 
     @app.route('/peer_connection', methods=['POST'])
     @HandleExceptions
-    def handle_peer_connection(cls):
+    @params('user_id', 'peer_id')
+    def handle_peer_connection(cls, user_id, peer_id):
         """
         Instruct peer to connect to user's provided socket endpoint
 
@@ -247,9 +337,8 @@ class ServerAPI:  # TODO: Potentially, subclass Thread since server is blocking
         peer_id : str
         socket_endpoint : tuple(str, int)
         """
-        user_id, peer_id = get_parameters(request.json, 'user_id', 'peer_id')
-        cls.logger.info(f"Received request from User {
-                        user_id} to connect with User {peer_id}.")
+        cls.logger.info("Received request from User %s to connect with User %s.",
+                        user_id, peer_id)
 
         endpoint = cls.server.handle_peer_connection(user_id, peer_id)
 
@@ -272,26 +361,31 @@ class SocketAPI(Thread):
     endpoint = None
     state = SocketState.NEW
     namespaces = None
-    users = {}
+
+    def __init__(self, users):
+        """
+        Parameters
+        ----------
+        users : tuple, list
+            User IDs expected to connect to this session
+        """
+        super().__init__()
+        # Per session, so expected users never leak into the next one
+        self.users = dict.fromkeys(users, False)
 
     # region --- Utils ---
-    logger = logging.getLogger('SocketAPI')  # TODO: Magic string is gross
+    logger = logger.getChild('SocketAPI')  # TODO: Magic string is gross
 
-    @classmethod
-    def has_all_users(cls):
-        for user in cls.users:
-            if not cls.users[user]:
-                return False
-        return True
+    def has_all_users(self):
+        return all(self.users.values())
 
-    @classmethod
-    def verify_connection(cls, user_id):
+    def verify_connection(self, user_id):
         """
         Parameters
         ----------
         user_id : str
         """
-        return user_id in cls.users
+        return user_id in self.users
 
     def HandleExceptions(endpoint_handler):
         """
@@ -323,29 +417,39 @@ class SocketAPI(Thread):
         users : tuple, list
             User IDs
         """
-        cls.logger.info(f"Initializing WebSocket API with endpoint {
-                        server.websocket_endpoint}.")
+        cls.logger.info("Initializing WebSocket API with endpoint %s.",
+                        server.websocket_endpoint)
         if cls.state >= SocketState.LIVE:
             raise ServerError(
                 f"Cannot reconfigure WebSocket API during runtime.")
 
         cls.server = server
+        # Settle the port here, before the peer is told where to connect
+        endpoint = server.websocket_endpoint
+        if not endpoint.ip:
+            raise ServerError(
+                f"Cannot start WebSocket API without an IP address; set SERVER_IP.")
+        port = _pick_open_port(endpoint.ip, endpoint.port)
+        if port != endpoint.port:
+            server.set_websocket_endpoint(Endpoint(endpoint.ip, port))
+            cls.logger.warning("Endpoint %s in use; using %s instead.",
+                               endpoint, server.websocket_endpoint)
         cls.endpoint = server.websocket_endpoint
         cls.state = SocketState.INIT
-        for user in users:
-            cls.users[user] = None
-        cls.instance = cls()
+        cls.instance = cls(users)
         return cls.instance
 
     def run(self):
         cls = SocketAPI
 
-        cls.namespaces = generate_flask_namespace(cls)
-        ns = sorted(list(cls.namespaces.keys()))
-        for name in ns:
-            cls.socketio.on_namespace(cls.namespaces[name])
+        # Namespaces only depend on the class, so they are built and
+        # registered once no matter how many times the socket restarts
+        if cls.namespaces is None:
+            cls.namespaces = generate_flask_namespace(cls)
+            for namespace in cls.namespaces.values():
+                cls.socketio.on_namespace(namespace)
 
-        cls.logger.info(f"Starting WebSocket API.")
+        cls.logger.info("Starting WebSocket API.")
         if cls.state == SocketState.NEW:
             raise ServerError(f"Cannot start API before initialization.")
         if cls.state == SocketState.LIVE or cls.state == SocketState.OPEN:
@@ -354,22 +458,12 @@ class SocketAPI(Thread):
         # cls.state = SocketState.LIVE # TODO: BE SURE TO UPDATE ON D/C OR SIMILAR
         # cls.socketio.run(cls.app, host=cls.endpoint.ip, port=cls.endpoint.port)
 
-        while True:
-            try:
-                cls.logger.info(f"Serving WebSocket API at {cls.endpoint}")
+        cls.logger.info("Serving WebSocket API at %s", cls.endpoint)
 
-                cls.state = SocketState.LIVE
-                cls.socketio.run(cls.app, host=cls.endpoint.ip,
-                                 port=cls.endpoint.port)
-            except OSError as e:
-                cls.logger.error(f"Endpoint {cls.endpoint} in use.")
-
-                cls.state = SocketState.INIT
-                cls.server.set_websocket_endpoint(
-                    Endpoint(cls.endpoint.ip, cls.endpoint.port + 1))
-                continue
-            cls.logger.info(f"WebSocket API terminated.")
-            break
+        cls.state = SocketState.LIVE
+        cls.socketio.run(cls.app, host=cls.endpoint.ip,
+                         port=cls.endpoint.port)
+        cls.logger.info("WebSocket API terminated.")
 
     @classmethod
     def kill(cls):
@@ -388,37 +482,38 @@ class SocketAPI(Thread):
     @HandleExceptions
     def on_connect(cls, user_id):
         cls.logger.info(
-            f"Received Socket connection request from User {user_id}.")
+            "Received Socket connection request from User %s.", user_id)
         if cls.state != SocketState.LIVE:
-            cls.logger.info(f"Cannot accept connection when already {
-                            SocketState.OPEN}.")
+            cls.logger.info("Cannot accept connection when already %s.",
+                            SocketState.OPEN)
             # raise UnknownRequester( ... ) # TODO: Maybe different name?
             # or
             # raise ConnectionRefusedError( ... )
             return False
-        if not cls.verify_connection(user_id):
-            cls.logger.info(f"Socket connection failed authentication.")
+        if not cls.instance.verify_connection(user_id):
+            cls.logger.info("Socket connection failed authentication.")
             # raise UnknownRequester( ... ) # TODO: Maybe different name?
             # or
             # raise ConnectionRefusedError( ... )
             return False
 
-        cls.logger.info(f"Socket connection from User {user_id} accepted")
+        cls.logger.info("Socket connection from User %s accepted", user_id)
+        cls.instance.users[user_id] = True
 
-        if cls.has_all_users():
+        if cls.instance.has_all_users():
             cls.logger.info("Socket API acquired all expected users.")
             cls.state = SocketState.OPEN
 
     @socketio.on('message')
     @HandleExceptions
     def on_message(cls, user_id, msg):
-        cls.logger.info(f"Received message from User {user_id}: '{msg}'")
+        cls.logger.info("Received message from User %s: '%s'", user_id, msg)
         send((user_id, msg), broadcast=True)
 
     @socketio.on('disconnect')
     @HandleExceptions
     def on_disconnect(cls):
-        cls.logger.info(f"Client disconnected.")
+        cls.logger.info("Client disconnected.")
         # Broadcast to all clients to disconnect
         # Close all connections (if that's a thing)
         # Kill Web Socket
@@ -1,6 +1,9 @@
+import atexit
 import os
 from logging import Formatter, getLogger, DEBUG, INFO, StreamHandler, FileHandler
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
+from queue import SimpleQueue
 
 
 now = datetime.now()
@@ -42,13 +45,19 @@ stream_handler = StreamHandler()
 stream_handler.setLevel(INFO)
 stream_handler.setFormatter(formatter)
 
-# Add the handlers to the logger
-logger.addHandler(stream_handler)
-
 # Create file handler which logs debug messages and set formatter
 file_handler = FileHandler(log_file_path, mode='a')  # append mode
 file_handler.setLevel(DEBUG)
 file_handler.setFormatter(formatter)
 
-# Add the file handler to the logger
-logger.addHandler(file_handler)
+# The logger only enqueues records; a listener formats and writes them
+# later. api.py monkey-patches threading before this import, so the listener
+# is a greenlet on the same hub: this moves the writes off the handler's own
+# path, but a blocking file write still stalls the hub while it runs
+log_queue = SimpleQueue()
+logger.addHandler(QueueHandler(log_queue))
+
+listener = QueueListener(log_queue, stream_handler, file_handler,
+                         respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
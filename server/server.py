@@ -1,4 +1,5 @@
 import requests
+from requests.adapters import HTTPAdapter
 
 from exceptions import InvalidState
 
@@ -7,6 +8,8 @@ from utils import ServerError, BadGateway, BadRequest, Endpoint
 from utils.user_manager import UserManager, UserStorageFactory, UserState
 from utils.user_manager import DuplicateUser, UserNotFound
 
+CLIENT_TIMEOUT = 5  # seconds
+
 
 # region --- Server ---
 class Server:
@@ -17,12 +20,18 @@ class Server:
         self.SocketAPI = SocketAPI
         self.SocketState = SocketState
 
-        self.api_endpoint = Endpoint(*api_endpoint)
-        logger.info(f"Intializing server with API Endpoint {
-            self.api_endpoint}")
+        self.api_endpoint = Endpoint.of(api_endpoint)
+        logger.info("Intializing server with API Endpoint %s",
+                    self.api_endpoint)
 
         self.websocket_endpoint = SocketAPI.DEFAULT_ENDPOINT
 
+        # Keep-alive connections to Client APIs, reused across requests
+        self.http = requests.Session()
+        self.http.mount('http://', HTTPAdapter(pool_connections=32,
+                                               pool_maxsize=64,
+                                               max_retries=0))
+
         with UserStorageFactory() as factory:
             storage = factory.create_storage(user_storage)
             self.user_manager = UserManager(storage=storage)
@@ -31,47 +40,49 @@ class Server:
     def add_user(self):
         try:
             user_id = self.user_manager.add_user()
-            logger.info(f"User {user_id} added.")
+            logger.info("User %s added.", user_id)
             return user_id
         except DuplicateUser as e:
             logger.error(str(e))
             raise e
 
     def get_user(self, user_id):
-        try:
-            user_info = self.user_manager.get_user(user_id)
-            logger.info(f"Retrieved user with ID {user_id}.")
-            return user_info
-        except UserNotFound as e:
-            logger.error(str(e))
-            raise e
+        """Returns the User with `user_id`, or None if there is none."""
+        user_info = self.user_manager.get_user(user_id)
+        if user_info is not None:
+            logger.info("Retrieved user with ID %s.", user_id)
+        return user_info
 
     def remove_user(self, user_id):
-        try:
-            self.user_manager.remove_user(user_id)
-            logger.info(f"User {user_id} removed successfully.")
-        except UserNotFound as e:
-            logger.error(str(e))
-            raise e
+        """Returns whether a User with `user_id` existed to be removed."""
+        removed = self.user_manager.remove_user(user_id)
+        if removed:
+            logger.info("User %s removed successfully.", user_id)
+        return removed
 
     def set_user_state(self, user_id, state: UserState, peer=None):
         try:
             self.user_manager.set_user_state(user_id, state, peer)
-            logger.info(f"Updated User {user_id} state: {
-                state} ({peer}).")
+            logger.info("Updated User %s state: %s (%s).",
+                        user_id, state, peer)
         except (UserNotFound, InvalidState) as e:
             logger.error(str(e))
             raise e
 
     def contact_client(self, user_id, route, json):
-        endpoint = self.get_user(user_id).api_endpoint(route)
-        logger.info(f"Contacting Client API for User {
-            user_id} at {endpoint}.")
+        user = self.get_user(user_id)
+        if user is None:
+            raise UserNotFound(f"Cannot contact User {
+                               user_id}: User does not exist.")
+        endpoint = user.api_endpoint(route)
+        logger.info("Contacting Client API for User %s at %s.",
+                    user_id, endpoint)
         try:
-            response = requests.post(str(endpoint), json=json)
+            response = self.http.post(str(endpoint), json=json,
+                                      timeout=CLIENT_TIMEOUT)
         except Exception as e:
-            logger.error(f"Unable to reach Client API for User {
-                user_id} at endpoint {endpoint}.")
+            logger.error("Unable to reach Client API for User %s at endpoint %s.",
+                         user_id, endpoint)
             # TODO: Figure out specifically what exception is raised so I can catch only that, and then handle it instead of re-raising (or maybe re-raise different exception and then caller can handle)
             raise e
         return response
@@ -80,13 +91,13 @@ class Server:
         # if self.state >= ClientState.LIVE:
         #     raise InternalClientError("Cannot change Web Socket endpoint after connection already estbablished.") # TODO: use InvalidState
 
-        self.websocket_endpoint = Endpoint(*endpoint)
+        self.websocket_endpoint = Endpoint.of(endpoint)
         self.SocketAPI.endpoint = self.websocket_endpoint
-        logger.info(f"Setting Web Socket endpoint: {
-            self.websocket_endpoint}")
+        logger.info("Setting Web Socket endpoint: %s",
+                    self.websocket_endpoint)
 
     def start_websocket(self, users):
-        logger.info(f"Starting WebSocket API.")
+        logger.info("Starting WebSocket API.")
         if not self.websocket_endpoint:
             raise ServerError(
                 f"Cannot start WebSocket API without defined endpoint.")
@@ -101,13 +112,11 @@ class Server:
 
         # TODO: Validate state(s)
         # if peer is not IDLE, reject
-        try:
-            user = self.get_user(user_id)
-        except UserNotFound as e:
+        users = self.user_manager.get_users_by_ids((user_id, peer_id))
+        user, peer = users[user_id], users[peer_id]
+        if user is None:
             raise BadRequest(f"User {user_id} does not exist.")
-        try:
-            peer = self.get_user(peer_id)
-        except UserNotFound as e:
+        if peer is None:
             raise BadRequest(f"User {peer_id} does not exist.")
 
         if peer.state != UserState.IDLE:
@@ -117,8 +126,8 @@ class Server:
             raise InvalidState(f"Cannot connect User {
                                user_id} to peer: User must be IDLE.")
 
-        logger.info(f"Contacting User {
-            peer_id} to connect to User {user_id}.")
+        logger.info("Contacting User %s to connect to User %s.",
+                    peer_id, user_id)
 
         self.start_websocket(users=(user_id, peer_id))
 
@@ -131,10 +140,10 @@ class Server:
             raise BadGateway(f"Unable to reach peer User {peer_id}.")
 
         if response.status_code != 200:
-            logger.error(f"Peer User {peer_id} refused connection request.")
+            logger.error("Peer User %s refused connection request.", peer_id)
             raise BadGateway(
                 f"Peer User {peer_id} refused connection request.")
-        logger.info(f"Peer User {peer_id} accepted connection request.")
+        logger.info("Peer User %s accepted connection request.", peer_id)
         return self.websocket_endpoint
 
 # endregion
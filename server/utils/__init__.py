@@ -1,3 +1,5 @@
+import socket
+import sys
 from enum import Enum
 from functools import total_ordering
 
@@ -11,11 +13,16 @@ class ClientState(Enum):
 
     def __lt__(self, other):
         if self.__class__ is other.__class__:
-            arr = list(self.__class__)
-            return arr.index(self) < arr.index(other)
+            return self._ord < other._ord
         return NotImplemented
 
 
+# Definition order, cached so comparisons don't rebuild the member list
+for _ord, _state in enumerate(ClientState):
+    _state._ord = _ord
+del _ord, _state
+
+
 class ServerError(Exception):
     pass
 
@@ -51,6 +58,14 @@ def remove_last_period(string):
     return string
 
 
+_MISSING = object()
+
+
+def _accept(_):
+    """Default validator: accepts any value."""
+    return True
+
+
 def get_parameters(data, *args):
     """
     Returns desired parameters from a collection with optional data validation.
@@ -67,7 +82,7 @@ def get_parameters(data, *args):
         If `data` is a dict
     """
     if isinstance(data, list) or isinstance(data, tuple):
-        if len(args == 0):
+        if len(args) == 0:
             return get_parameters_from_sequence(data)
         return get_parameters_from_sequence(data, args[0])
     if isinstance(data, dict):
@@ -93,17 +108,12 @@ def get_parameters_from_sequence(data, validators=[]):
         raise ParameterError(
             f"Expected {len(validators)} parameters but received {len(data)}.")
 
-    param_vals = ()
-    for i in range(len(data)):
-        param_val = data[i]
-        validator = validators[i]
-        if not validator:
-            validator = lambda x: True
-
-        if not validator(param_val):
+    param_vals = []
+    for i, (param_val, validator) in enumerate(zip(data, validators)):
+        if not (validator or _accept)(param_val):
             raise InvalidParameter(f"Parameter {i + 1} failed validation.")
-        param_vals += (*param_vals, param_val)
-    return param_vals
+        param_vals.append(param_val)
+    return tuple(param_vals)
 
 
 def get_parameters_from_dict(data, *args):
@@ -118,32 +128,69 @@ def get_parameters_from_dict(data, *args):
         Key of desired data
     arg : tuple(str, func), optional
     """
-    param_vals = ()
-    for i in range(len(args)):
-        arg = args[i]
-        validator = lambda x: True
+    param_vals = []
+    for arg in args:
+        validator = _accept
         if type(arg) is tuple:
             param, validator = arg
         else:
             param = arg
 
-        if param in data:
-            param_val = data.get(param)
-        else:
+        param_val = data.get(param, _MISSING)
+        if param_val is _MISSING:
             raise ParameterError(f"Expected parameter '{param}' not received.")
 
         if not validator(param_val):
             raise InvalidParameter(f"Parameter '{param}' failed validation.")
 
-        param_vals = (*param_vals, param_val)
-    return param_vals
+        param_vals.append(param_val)
+    return tuple(param_vals)
 
 
 def is_type(type_):
     return lambda x: isinstance(x, type_)
 
 
+SOCKET_BUFFER_SIZE = 1 << 20  # 1 MiB
+
+
+def configure_socket(sock):
+    """
+    Tunes a TCP socket for low-latency streaming: disables Nagle's algorithm
+    and raises the kernel send/receive buffers to `SOCKET_BUFFER_SIZE`.
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+
+
+def create_listener(address, backlog=128):
+    """
+    Returns a bound, listening TCP socket at `address` configured with
+    `configure_socket`. Accepted connections inherit these options.
+    Raises OSError if the address is in use.
+
+    Parameters
+    ----------
+    address : tuple(str, int)
+    backlog : int, optional
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        if sys.platform != 'win32':
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        configure_socket(sock)
+        sock.bind(address)
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
 class Endpoint:
+    __slots__ = ('ip', 'port', 'route', '_str')
+
     def __init__(self, ip: str, port: int, route: str = None):
         if not ip:
             self.ip = None
@@ -165,12 +212,21 @@ class Endpoint:
         else:
             self.route = route
 
+        # Endpoints are not modified after construction, so format once
+        self._str = self.to_string()
+
     def __call__(self, route: str):
         if not route:
             return self
-        endpoint = Endpoint(*self)
-        endpoint.route = route
-        return Endpoint(*endpoint)  # Re-instantiating fixes slashes in `route`
+        return Endpoint(self.ip, self.port, route)  # __init__ fixes slashes
+
+    @classmethod
+    def of(cls, endpoint):
+        """Returns `endpoint` as an Endpoint; Endpoints are immutable, so an
+        existing one is returned as-is rather than copied."""
+        if isinstance(endpoint, Endpoint):
+            return endpoint
+        return cls(*endpoint)
 
     def to_string(self):
         ip = self.ip if self.ip else 'localhost'
@@ -179,13 +235,13 @@ class Endpoint:
         return f"http://{ip}{port}{route}"
 
     def __str__(self):
-        return self.to_string()
+        return self._str
 
     def __repr__(self):
-        return self.to_string()
+        return self._str
 
     def __unicode__(self):
-        return self.to_string()
+        return self._str
 
     def __iter__(self):
         yield self.ip if self.ip else 'localhost'
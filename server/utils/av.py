@@ -2,6 +2,7 @@ import asyncio
 import cv2
 import ffmpeg
 import pyaudio
+import struct
 import time
 import numpy as np
 from flask_socketio import send
@@ -13,6 +14,10 @@ from utils import ClientState
 from utils.encryption import KeyGeneratorFactory, EncryptionFactory, EncryptionScheme
 
 
+# Big-endian uint32 key index prefixed to every AV message
+_HDR = struct.Struct('>I')
+
+
 def display_message(user_id, msg):
     print(f"({user_id}): {msg}")
 
@@ -52,10 +57,7 @@ class TestClientNamespace(ClientNamespace):
     def on_message(self, user_id, msg):
         msg = '/test: ' + msg
         # self.cls.logger.info(f"Received /test message from user {user_id}: {msg}")
-
-        async def disp():
-            display_message(user_id, msg)
-        asyncio.run(disp())
+        display_message(user_id, msg)
 
 # endregion
 
@@ -104,35 +106,6 @@ class AVClientNamespace(ClientNamespace):
 # endregion
 
 
-# region --- Key Distributions ---
-
-class KeyClientNamespace(AVClientNamespace):
-
-    def on_connect(self):
-        super().on_connect()
-        self.key_idx = 0
-
-        async def gen_keys():
-            await asyncio.sleep(2)
-            print('send_keys')
-            while True:
-                self.av.key_gen.generate_key(key_length=128)
-                key = self.key_idx.to_bytes(
-                    4, 'big') + self.av.key_gen.get_key().tobytes()
-                self.key_idx += 1
-
-                await self.av.key_queue[self.cls.user_id][self.namespace].put(key)
-                await asyncio.sleep(1)
-
-        Thread(target=asyncio.run, args=(gen_keys(),)).start()
-
-    def on_message(self, user_id, msg):
-        super().on_message(user_id, msg)
-        # asyncio.run(self.av.key_queue[user_id][self.namespace].put(msg))
-
-# endregion
-
-
 # region --- Audio ---
 
 class AudioClientNamespace(AVClientNamespace):
@@ -158,7 +131,7 @@ class AudioClientNamespace(AVClientNamespace):
 
                 if self.av.encryption is not None:
                     data = self.av.encryption.encrypt(data, key)
-                self.send(cur_key_idx.to_bytes(4, 'big') + data)
+                self.send(_HDR.pack(cur_key_idx) + data)
                 await asyncio.sleep(self.av.audio_wait)
 
         Thread(target=asyncio.run, args=(send_audio(),)).start()
@@ -166,23 +139,20 @@ class AudioClientNamespace(AVClientNamespace):
     def on_message(self, user_id, msg):
         super().on_message(user_id, msg)
 
-        async def handle_message():
-            if user_id == self.cls.user_id:
-                return
-
-            cur_key_idx, key = self.av.key
+        if user_id == self.cls.user_id:
+            return
 
-            key_idx = int.from_bytes(msg[:4], 'big')
-            if (key_idx != cur_key_idx):
-                return
-            data = msg[4:]
+        cur_key_idx, key = self.av.key
 
-            data = self.av.encryption.decrypt(data, key)
+        (key_idx,) = _HDR.unpack_from(msg)
+        if (key_idx != cur_key_idx):
+            return
+        data = msg[4:]
 
-            self.stream.write(
-                data, num_frames=self.av.frames_per_buffer, exception_on_underflow=False)
+        data = self.av.encryption.decrypt(data, key)
 
-        asyncio.run(handle_message())
+        self.stream.write(
+            data, num_frames=self.av.frames_per_buffer, exception_on_underflow=False)
 
 # endregion
 
@@ -232,7 +202,7 @@ class VideoClientNamespace(AVClientNamespace):
 
                 data = self.av.encryption.encrypt(data, key)
 
-                self.send(cur_key_idx.to_bytes(4, 'big') + data)
+                self.send(_HDR.pack(cur_key_idx) + data)
                 # self.cls.video[self.cls.user_id] = data
 
                 end = time.time()
@@ -245,39 +215,36 @@ class VideoClientNamespace(AVClientNamespace):
     def on_message(self, user_id, msg):
         super().on_message(user_id, msg)
 
-        async def handle_message():
-            if user_id == self.cls.user_id:
-                # self.av.key = self.av.key_gen.get_key().tobytes()
-                return
-
-            start = time.time()
+        if user_id == self.cls.user_id:
+            # self.av.key = self.av.key_gen.get_key()
+            return
 
-            # the stuff in comments got moved to the main thread because cv2 needs to be in the main thread for macOS
-            # cv2.namedWindow(f"User {user_id}", cv2.WINDOW_NORMAL)
-            # cv2.resizeWindow(f"User {user_id}", self.av.display_shape[1], self.av.display_shape[0])
-            cur_key_idx, key = self.av.key
+        start = time.time()
 
-            key_idx = int.from_bytes(msg[:4], 'big')
-            if (key_idx != cur_key_idx):
-                return
-            data = msg[4:]
+        # the stuff in comments got moved to the main thread because cv2 needs to be in the main thread for macOS
+        # cv2.namedWindow(f"User {user_id}", cv2.WINDOW_NORMAL)
+        # cv2.resizeWindow(f"User {user_id}", self.av.display_shape[1], self.av.display_shape[0])
+        cur_key_idx, key = self.av.key
 
-            data = self.av.encryption.decrypt(data, key)
+        (key_idx,) = _HDR.unpack_from(msg)
+        if (key_idx != cur_key_idx):
+            return
+        data = msg[4:]
 
-            data = self.output.run(
-                input=data, capture_stdout=True, quiet=True)[0]
+        data = self.av.encryption.decrypt(data, key)
 
-            data = np.frombuffer(data, dtype=np.uint8).reshape(
-                self.av.video_shape)
+        data = self.output.run(
+            input=data, capture_stdout=True, quiet=True)[0]
 
-            self.cls.video[user_id] = data
-            # cv2.imshow(f"User {user_id}", data)
-            # cv2.waitKey(1)
+        data = np.frombuffer(data, dtype=np.uint8).reshape(
+            self.av.video_shape)
 
-            end = time.time()
-            # print("max recv framerate:", 1/(end-start))
+        self.cls.video[user_id] = data
+        # cv2.imshow(f"User {user_id}", data)
+        # cv2.waitKey(1)
 
-        asyncio.run(handle_message())
+        end = time.time()
+        # print("max recv framerate:", 1/(end-start))
 
 # endregion
 
@@ -286,8 +253,6 @@ class VideoClientNamespace(AVClientNamespace):
 
 class AV:
     namespaces = {
-        # '/video_key'    : (BroadcastFlaskNamespace, KeyClientNamespace),
-        # '/audio_key'    : (BroadcastFlaskNamespace, KeyClientNamespace),
         '/video': (BroadcastFlaskNamespace, VideoClientNamespace),
         '/audio': (BroadcastFlaskNamespace, AudioClientNamespace),
     }
@@ -310,7 +275,7 @@ class AV:
         self.frames_per_buffer = self.sample_rate // 6
         self.audio_wait = 1 / 8
 
-        self.key = self.key_gen.get_key().tobytes()
+        self.key = self.key_gen.get_key()
 
         self.encryption = encryption
 
@@ -321,7 +286,7 @@ class AV:
             key_idx = 0
             while True:
                 self.key_gen.generate_key(key_length=128)
-                self.key = key_idx, self.key_gen.get_key().tobytes()
+                self.key = key_idx, self.key_gen.get_key()
                 key_idx += 1
 
                 await asyncio.sleep(1)
@@ -2,10 +2,10 @@ from abc import ABC, abstractmethod
 from bitarray import bitarray
 import os
 import string
+import numpy as np
 import logging
 import secrets
 from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
 from Crypto.Random import get_random_bytes
 
 # Initialize logging
@@ -33,24 +33,31 @@ class EncryptionScheme(ABC):
         """Returns the Encryption Scheme's name."""
         pass
 
+def xor_bytes(data, key):
+    """
+    XORs `data` with `key`, truncated to the shorter of the two.
+    Works eight bytes at a time on uint64 views; the < 8 byte tail
+    is handled separately.
+    """
+    n = min(len(data), len(key))
+    words = n // 8
+    head = np.bitwise_xor(np.frombuffer(data, dtype=np.uint64, count=words),
+                          np.frombuffer(key, dtype=np.uint64, count=words))
+    tail = bytes(a ^ b for a, b in zip(data[words * 8:n], key[words * 8:n]))
+    return head.tobytes() + tail
+
 class XOREncryption(EncryptionScheme):
     
     def __init__(self):
         self.name = "XOR"
 
-    # data and key are bit arrays with same length
+    # data and key are bytes with same length
     def encrypt(self, data, key):
-        result = bitarray()
-        for bit1, bit2 in zip(data, key):
-            result.append(bit1 ^ bit2)
-        return result
+        return xor_bytes(data, key)
     
-    # data and key are bit arrays with same length
+    # data and key are bytes with same length
     def decrypt(self, data, key):
-        result = bitarray()
-        for bit1, bit2 in zip(data, key):
-            result.append(bit1 ^ bit2)
-        return result
+        return xor_bytes(data, key)
     
     def get_name(self):
         return self.name
@@ -68,35 +75,31 @@ class DebugEncryption(EncryptionScheme):
     def get_name(self):
         return self.name
     
-import numpy as np
+NONCE_SIZE = 12  # 96-bit nonces skip the extra GHASH pass in GCM
+TAG_SIZE = 16
+
 class AESEncryption(EncryptionScheme):
     def __init__(self, bits=128):
         self.bits = bits
         self.name = f"AES-{bits}"
         self.results = []
         
-    # data and key are bit arrays
-    # using AES-CBC
+    # data and key are bytes
+    # using AES-GCM; output is nonce + tag + ciphertext
     def encrypt(self, data, key):
-        # print(len(data))
-        cipher = AES.new(key, AES.MODE_CBC, iv=b'0'*16)
-        data = pad(data, AES.block_size)
-        cipheredData = cipher.encrypt(data)
-        result_data = cipheredData
-        result_iv = cipher.iv
-        return result_data
-    
-    # data and key are bit arrays
-    # data contains iv and encrypted data
+        cipher = AES.new(key, AES.MODE_GCM,
+                         nonce=get_random_bytes(NONCE_SIZE))
+        cipheredData, tag = cipher.encrypt_and_digest(data)
+        return cipher.nonce + tag + cipheredData
+    
+    # data and key are bytes
+    # data contains nonce, tag and encrypted data
     def decrypt(self, data, key):
-        # print(len(data))
-        iv = b'0'*16
-        cipheredData = data
-        cipher = AES.new(key, AES.MODE_CBC, iv)
-        decrypted = cipher.decrypt(cipheredData)
-        decrypted = unpad(decrypted, AES.block_size)
-        result = decrypted
-        return result
+        nonce = data[:NONCE_SIZE]
+        tag = data[NONCE_SIZE:NONCE_SIZE + TAG_SIZE]
+        cipheredData = data[NONCE_SIZE + TAG_SIZE:]
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        return cipher.decrypt_and_verify(cipheredData, tag)
     
     def get_name(self):
         return self.name
@@ -131,6 +134,8 @@ class KeyGenerator(ABC):
         """Return the generated key."""
         pass
     
+DEBUG_KEY_BYTE = b'\x55'  # 0b01010101
+
 class DebugKeyGenerator(KeyGenerator):
     def __init__(self):
             self.key: bitarray = bitarray()
@@ -139,7 +144,9 @@ class DebugKeyGenerator(KeyGenerator):
     def speficied_keylength(self, length):
         self.key_length = length
         # Default debug key is alternating 1 and 0
-        self.key = bitarray([i % 2 for i in range(self.key_length)])
+        self.key = bitarray()
+        self.key.frombytes(DEBUG_KEY_BYTE * ((self.key_length + 7) // 8))
+        del self.key[self.key_length:]
         
     def specified_key(self, key):
         bit_array = bitarray()
@@ -169,12 +176,12 @@ class DebugKeyGenerator(KeyGenerator):
             raise ValueError("Invalid parameters")
         
     def get_key(self):
-        return self.key
+        return self.key.tobytes()
     
 class RandomKeyGenerator(KeyGenerator):
     def __init__(self, key_length = 0):
         self.key_length = key_length
-        self.key: bitarray = None
+        self.key: bytes = None
         
     def generate_key(self, key_length = 0):
         if key_length:
@@ -182,7 +189,7 @@ class RandomKeyGenerator(KeyGenerator):
         elif self.key_length < 1:
             # logger.error(f"Try to make key of length {key_length}")
             raise ValueError("Error, please make key length nonzero")
-        self.key = bitarray([int(b) for b in format(int.from_bytes(os.urandom((self.key_length + 7) // 8), 'big'), f'0{self.key_length}b')[:self.key_length]])
+        self.key = os.urandom((self.key_length + 7) // 8)
 
     def get_key(self):
         return self.key
@@ -190,7 +197,7 @@ class RandomKeyGenerator(KeyGenerator):
 class FileKeyGenerator(KeyGenerator):
     def __init__(self, file_name = os.path.dirname(__file__) + "/key.bin", key_length = 0):
         self.key_length = key_length
-        self.key: bitarray = None
+        self.key: bytes = None
         self.file_name = file_name
         self.file = open(self.file_name, "rb")
         
@@ -200,8 +207,7 @@ class FileKeyGenerator(KeyGenerator):
         elif self.key_length < 1:
             # logger.error(f"Try to make key of length {key_length}")
             raise ValueError("Error, please make key length nonzero")
-        self.key = bitarray()
-        self.key.frombytes(self.file.read((key_length+7)//8))
+        self.key = self.file.read((key_length+7)//8)
 
     def get_key(self):
         return self.key
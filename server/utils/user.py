@@ -9,8 +9,10 @@ class UserState(Enum):
 
 
 class User:
+    __slots__ = ('api_endpoint', 'state', 'peer')
+
     def __init__(self, api_endpoint: Endpoint, state=UserState.IDLE, peer=None):
-        self.api_endpoint = Endpoint(*api_endpoint)
+        self.api_endpoint = Endpoint.of(api_endpoint) if api_endpoint else None
         self.state = state
         self.peer = peer
 
@@ -1,10 +1,11 @@
 # from __future__ import annotations
 
 # region --- Logging ---
-import hashlib
-from random import choice
-from string import ascii_letters, digits
-from abc import ABC, abstractmethod
+import sys
+from hashlib import sha256
+from random import choices
+from string import ascii_lowercase, digits
+from typing import Final, Optional, Protocol
 from .user import User
 from .user import UserState
 from custom_logging import logger
@@ -24,69 +25,117 @@ class UserNotFound(Exception):
 
 class InvalidState(Exception):
     pass
+
+
+_ID_ALPHABET: Final[str] = ascii_lowercase + digits
+
+
+# Copying an initialised context is cheaper than setting up a new one
+_SHA256_PROTO = sha256()
+
+
+def _token_for(user_id):
+    h = _SHA256_PROTO.copy()
+    h.update(user_id.encode('ascii'))  # IDs are drawn from _ID_ALPHABET
+    return h.hexdigest()
 # endregion
 
 
 # region --- Storage ---
 
 
-class UserStorageInterface(ABC):
+class UserStorageInterface(Protocol):
 
-    @abstractmethod
-    def add_user(self, user_id, user_info):
-        pass
+    def add_user(self, user_id, user_info): ...
 
-    @abstractmethod
-    def update_user(self, user_id, user_info):
-        pass
+    def add_users(self, user_ids): ...
 
-    @abstractmethod
-    def get_user(self, user_id):
-        pass
+    def update_user(self, user_id, user_info): ...
 
-    @abstractmethod
-    def remove_user(self, user_id):
-        pass
+    def set_state(self, user_id, state, peer): ...
 
-    @abstractmethod
-    def has_user(self, user_id):
-        pass
+    def get_user(self, user_id): ...
+
+    def get_users(self, user_ids): ...
 
+    def remove_user(self, user_id): ...
 
-class DictUserStorage(UserStorageInterface):
+    def has_user(self, user_id): ...
+
+
+class DictUserStorage:
+    """
+    Keeps each User field in its own dict keyed by user ID, so state changes
+    are plain stores and `User` objects are only built when asked for.
+    `states` doubles as the set of known users.
+    """
 
     def __init__(self):
-        self.users = {}
+        self.states = {}
+        self.peers = {}
+        self.endpoints = {}
 
     def add_user(self, user_id, user_info):
-        if user_id in self.users:
+        user_id = sys.intern(user_id)
+        if user_info is None:
+            user_info = User(None)
+        if user_id in self.states:
             raise DuplicateUser(f"Cannot add user {
                                 user_id}: User already exists.")
-        self.users[user_id] = user_info
+        self.states[user_id] = user_info.state
+        self.peers[user_id] = user_info.peer
+        self.endpoints[user_id] = user_info.api_endpoint
+
+    def add_users(self, user_ids):
+        """Adds idle Users for `user_ids`, which must not already exist."""
+        self.states.update(dict.fromkeys(user_ids, UserState.IDLE))
+        self.peers.update(dict.fromkeys(user_ids))
+        self.endpoints.update(dict.fromkeys(user_ids))
 
     def update_user(self, user_id, user_info):
-        if user_id not in self.users:
+        if user_id not in self.states:
             raise UserNotFound(f"Cannot update user {
                                user_id}: User does not exist.")
-        self.users[user_id] = user_info
+        self.states[user_id] = user_info.state
+        self.peers[user_id] = user_info.peer
+        self.endpoints[user_id] = user_info.api_endpoint
 
-    def get_user(self, user_id):
-        if user_id not in self.users:
-            raise UserNotFound(f"Cannot get user {
+    def set_state(self, user_id, state, peer):
+        if user_id not in self.states:
+            raise UserNotFound(f"Cannot update user {
                                user_id}: User does not exist.")
-        return self.users.get(user_id, None)
+        self.states[user_id] = state
+        self.peers[user_id] = peer
+
+    def get_user(self, user_id):
+        """Returns the User with `user_id`, or None if there is none."""
+        state = self.states.get(user_id)
+        if state is None:
+            return None
+        return User(self.endpoints[user_id], state, self.peers[user_id])
+
+    def get_users(self, user_ids):
+        """Maps each of `user_ids` to its User, or None if there is none."""
+        return {user_id: self.get_user(user_id) for user_id in user_ids}
 
     def remove_user(self, user_id):
-        if user_id not in self.users:
-            raise UserNotFound(f"Cannot remove user {
-                               user_id}: User does not exist.")
-        del self.users[user_id]
+        """Returns whether a User with `user_id` existed to be removed."""
+        if self.states.pop(user_id, None) is None:
+            return False
+        del self.peers[user_id]
+        del self.endpoints[user_id]
+        return True
 
     def has_user(self, user_id):
-        return user_id in self.users
+        return user_id in self.states
 
 
 class UserStorageFactory:
+    # New backends register here rather than growing an if/elif chain
+    storage_types: dict[str, type[UserStorageInterface]] = {
+        'DICT': DictUserStorage,
+    }
+
     def __init__(self):
         pass
 
@@ -97,10 +146,10 @@ class UserStorageFactory:
         pass
 
     def create_storage(self, storage_type: str, **kwargs) -> UserStorageInterface:
-        if storage_type == 'DICT':
-            return DictUserStorage()
-        else:
+        storage_cls = self.storage_types.get(storage_type)
+        if storage_cls is None:
             raise ValueError(f"Invalid storage type: {storage_type}")
+        return storage_cls(**kwargs)
 # endregion
 
 
@@ -114,65 +163,81 @@ class UserManager:
 
     # I would personally just generate a completely random string every time, but we do this in Andy's interest of having perfect reproducibility during testing
     def generate_user_id(self):
-        # logger.debug(f"Generating User ID for user with API Endpoint {endpoint}.")
-        # hash_object = hashlib.sha256(endpoint.encode())
-        # user_id = hash_object.hexdigest()[:5]
-
-        # while self.storage.has_user(user_id):
-        #     hash_object = hashlib.sha256(hash_object.hexdigest().encode())
-        #     user_id = hash_object.hexdigest()[:5]
-
-        return ''.join(choice(ascii_letters + digits) for _ in range(5)).lower()
+        # Redraw on collision so add_user never hits DuplicateUser for a
+        # freshly generated ID
+        user_id = ''.join(choices(_ID_ALPHABET, k=5))
+        while self.storage.has_user(user_id):
+            user_id = ''.join(choices(_ID_ALPHABET, k=5))
+        # Interned so every later lookup shares one string with a cached hash
+        return sys.intern(user_id)
 
     # See note for generate_user_id(); the particular choice of seed here is a bit AIDS, though.
     # Also note uniqueness is not strictly necessary for tokens, so I've omitted it.
     def generate_token(self, user_id):
-        logger.debug(f"Generating token for User {user_id}.")
-        hash_object = hashlib.sha256(user_id.encode())
-        token = hash_object.hexdigest()
-
-        return token
+        logger.debug("Generating token for User %s.", user_id)
+        return _token_for(user_id)
 
     def add_user(self):
         user_id = self.generate_user_id()
         # user_info = User(endpoint)
         try:
             self.storage.add_user(user_id, None)
-            logger.debug(f"Added User {user_id}'.")
+            logger.debug("Added User %s.", user_id)
             return user_id
         except DuplicateUser as e:
             logger.error(str(e))
             raise e
 
+    def add_users(self, n: int) -> list[str]:
+        """Adds `n` new users at once and returns their IDs."""
+        # One choices() call draws every ID; the dict dedupes the batch
+        # while keeping order, and colliding IDs are redrawn
+        user_ids = {}
+        while len(user_ids) < n:
+            chars = ''.join(choices(_ID_ALPHABET, k=5 * (n - len(user_ids))))
+            for i in range(0, len(chars), 5):
+                user_id = chars[i:i + 5]
+                if not self.storage.has_user(user_id):
+                    user_ids[sys.intern(user_id)] = None
+
+        user_ids = list(user_ids)
+        self.storage.add_users(user_ids)
+        logger.debug("Added %d Users.", n)
+        return user_ids
+
     def set_user_state(self, user_id, state: UserState, peer=None):
-        if (state == UserState.IDLE) ^ (peer == None):
+        if (state is UserState.IDLE) != (peer is None):
             raise InvalidState(f"Cannot set state {state} ({peer}) for User {
                                user_id}: Invalid state.")
 
         try:
-            user_info = self.storage.get_user(user_id)
-            user_info.state = state
-            user_info.peer = peer
-            self.storage.update_user(user_id, user_info)
-            logger.debug(f"Updated User {user_id} state: {
-                state} ({peer}).")
+            self.storage.set_state(user_id, state, peer)
+            logger.debug("Updated User %s state: %s (%s).",
+                         user_id, state, peer)
         except UserNotFound as e:
             logger.error(str(e))
             raise e
 
-    def get_user(self, user_id) -> User:
-        try:
-            user_info = self.storage.get_user(user_id)
-            logger.debug(f"Retrieved user info for User {user_id}.")
-            return User(*user_info)
-        except UserNotFound as e:
-            logger.error(str(e))
-            raise e
-
-    def remove_user(self, user_id):
-        try:
-            self.storage.remove_user(user_id)
-            logger.debug(f"Removed User {user_id}.")
-        except UserNotFound as e:
-            logger.error(str(e))
+    def get_user(self, user_id) -> Optional[User]:
+        user = self.storage.get_user(user_id)
+        if user is None:
+            logger.debug("User %s does not exist.", user_id)
+        else:
+            logger.debug("Retrieved user info for User %s.", user_id)
+        return user
+
+    def get_users_by_ids(self, user_ids) -> dict[str, Optional[User]]:
+        """Looks up several Users with one storage call."""
+        users = self.storage.get_users(user_ids)
+        logger.debug("Retrieved user info for Users %s.", list(user_ids))
+        return users
+
+    def remove_user(self, user_id) -> bool:
+        removed = self.storage.remove_user(user_id)
+        if removed:
+            logger.debug("Removed User %s.", user_id)
+        else:
+            logger.debug("Cannot remove User %s: User does not exist.",
+                         user_id)
+        return removed
 # endregion